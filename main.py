@@ -11,10 +11,12 @@
 """
 
 import asyncio
+import logging
 import time
 import traceback
 import uuid
-from typing import Optional
+from types import MappingProxyType
+from typing import Any, AsyncGenerator, Optional
 
 import jwt
 from astrbot import logger
@@ -65,6 +67,29 @@ ws_server: Optional[StandaloneWebSocketServer] = None
 WS_DEFAULT_HOST = "0.0.0.0"
 WS_DEFAULT_PORT = 6190
 
+# 平台适配器默认配置（只读），同时作为注册模板和读取配置时的缺省值，避免两处默认值不一致
+ADAPTER_DEFAULT_CONFIG = MappingProxyType({
+    "type": "desktop_assistant",
+    "enable": True,
+    "id": "desktop_assistant",
+    # WebSocket 配置
+    "ws_host": WS_DEFAULT_HOST,
+    "ws_port": WS_DEFAULT_PORT,
+    # 桌面监控配置
+    "enable_desktop_monitor": True,
+    "monitor_interval": 60,
+    "max_screenshots": 20,
+    "screenshot_max_age_hours": 24,
+    # 主动对话配置
+    "enable_proactive_dialog": True,
+    "proactive_min_interval": 300,
+    "proactive_max_interval": 900,
+    "proactive_probability": 0.3,
+    "window_change_enabled": True,
+    "window_change_probability": 0.2,
+    "scheduled_greetings_enabled": True,
+})
+
 
 def _message_chain_to_text(message) -> str:
     """将消息链转换为纯文本，用于客户端显示
@@ -137,6 +162,19 @@ def _message_chain_to_text(message) -> str:
     return ""
 
 
+async def _send_chain_to_client(session_id: str, message_chain: MessageChain):
+    """通过 WebSocket 将消息链发送到指定客户端"""
+    try:
+        msg_data = {
+            "type": "message",
+            "content": str(message_chain),  # 暂时转换为字符串，后续优化为结构化数据
+            "session_id": session_id
+        }
+        await client_manager.send_message(session_id, msg_data)
+    except Exception as e:
+        logger.error(f"WebSocket 发送消息失败: {e}")
+
+
 # ============================================================================
 # 插件主类
 # ============================================================================
@@ -159,6 +197,8 @@ class Main(star.Star):
         self.context = context
         self.config = config
         self._jwt_secret = None
+        # 处理聊天消息的平台适配器（首次查找后缓存）
+        self._chat_adapter: Optional["DesktopAssistantAdapter"] = None
         try:
             dashboard_config = self.context.get_config().get("dashboard", {})
             self._jwt_secret = dashboard_config.get("jwt_secret")
@@ -213,9 +253,9 @@ class Main(star.Star):
         # 所以需要在这里手动创建适配器实例并添加到 platform_insts
         try:
             platform_config = {
-                "type": "desktop_assistant",
-                "enable": True,
-                "id": "desktop_assistant",
+                "type": ADAPTER_DEFAULT_CONFIG["type"],
+                "enable": ADAPTER_DEFAULT_CONFIG["enable"],
+                "id": ADAPTER_DEFAULT_CONFIG["id"],
                 "ws_host": config.get("ws_host", WS_DEFAULT_HOST),
                 "ws_port": config.get("ws_port", WS_DEFAULT_PORT),
             }
@@ -251,23 +291,14 @@ class Main(star.Star):
         image_base64 = data.get("image_base64")
         image_path = None
         if image_base64:
-            image_path = client_manager.save_base64_image(image_base64, "chat_image")
+            image_path = await client_manager.save_base64_image(image_base64, "chat_image")
         if not content and not image_path:
             return
         logger.info(
             f"收到客户端聊天消息: session_id={session_id}, content_len={len(content)}"
         )
 
-        adapter = None
-        for platform in self.context.platform_manager.platform_insts:
-            try:
-                meta = platform.meta()
-                if meta.name == "desktop_assistant":
-                    adapter = platform
-                    break
-            except Exception:
-                continue
-
+        adapter = self._get_chat_adapter()
         if not adapter:
             logger.warning("未找到 desktop_assistant 平台适配器，无法处理聊天消息")
             return
@@ -290,12 +321,35 @@ class Main(star.Star):
         except Exception as e:
             logger.error(f"处理客户端聊天消息失败: {e}")
     
+    def _get_chat_adapter(self) -> Optional["DesktopAssistantAdapter"]:
+        """
+        查找 desktop_assistant 平台适配器，找到后缓存，避免每条消息都调用各平台的 meta()
+        
+        缓存的实例不在 platform_insts 中（平台被重载或停用）时重新查找。
+        """
+        platform_insts = self.context.platform_manager.platform_insts
+        if self._chat_adapter is not None and self._chat_adapter in platform_insts:
+            return self._chat_adapter
+        self._chat_adapter = None
+        for platform in platform_insts:
+            try:
+                meta = platform.meta()
+                if meta.name == "desktop_assistant":
+                    self._chat_adapter = platform
+                    break
+            except Exception:
+                continue
+        return self._chat_adapter
+    
     async def terminate(self):
         """插件终止时的清理操作"""
         global ws_server
         
         logger.info("正在清理桌面悬浮球助手插件...")
         
+        # 丢弃缓存的适配器，避免重载后继续向已终止的实例投递消息
+        self._chat_adapter = None
+        
         # 停止过期请求清理任务
         try:
             await client_manager.stop_cleanup_task()
@@ -361,12 +415,14 @@ class Main(star.Star):
                     # 更新 AstrBot 核心的 provider_tts_settings
                     if "provider_tts_settings" in astrbot_config:
                         old_value = astrbot_config["provider_tts_settings"].get("dual_output", False)
-                        astrbot_config["provider_tts_settings"]["dual_output"] = dual_output
-                        
-                        logger.info(
-                            f"TTS dual_output 配置已同步: {old_value} -> {dual_output} "
-                            f"(来自客户端 {session_id[:16]}...)"
-                        )
+                        # 客户端每次重连都会重新同步配置，值未变化时不写入也不记录日志
+                        if old_value != dual_output:
+                            astrbot_config["provider_tts_settings"]["dual_output"] = dual_output
+                            
+                            logger.info(
+                                f"TTS dual_output 配置已同步: {old_value} -> {dual_output} "
+                                f"(来自客户端 {session_id[:16]}...)"
+                            )
                     else:
                         logger.warning("AstrBot 配置中未找到 provider_tts_settings")
                 
@@ -376,7 +432,6 @@ class Main(star.Star):
                 
         except Exception as e:
             logger.error(f"处理配置同步失败: {e}")
-            import traceback
             traceback.print_exc()
 
     def _validate_ws_token(self, token: str) -> bool:
@@ -672,19 +727,42 @@ class DesktopMessageEvent(AstrMessageEvent):
         
     async def send(self, message: MessageChain):
         """发送消息"""
-        # 通过 WebSocket 发送消息到客户端
-        try:
-            msg_data = {
-                "type": "message",
-                "content": str(message),  # 暂时转换为字符串，后续优化为结构化数据
-                "session_id": self.session_id
-            }
-            # 尝试直接发送给对应的 session
-            await client_manager.send_message(self.session_id, msg_data)
-        except Exception as e:
-            logger.error(f"WebSocket 发送消息失败: {e}")
-            
+        await _send_chain_to_client(self.session_id, message)
         await super().send(message)
+    
+    async def send_streaming(
+        self,
+        generator: AsyncGenerator[MessageChain, None],
+        use_fallback: bool = False,
+    ):
+        """发送流式消息
+        
+        客户端按整条消息渲染，逐分片推送会让每个 token 都触发一次
+        WebSocket 发送和客户端重绘，因此先合并全部分片再一次性发送。
+        相邻的纯文本分片合并为一个 Plain 组件，避免消息链随 token 数膨胀。
+        """
+        buffer: Optional[MessageChain] = None
+        components = []
+        pending_text = []
+        async for chain in generator:
+            if buffer is None:
+                buffer = chain
+            for comp in chain.chain:
+                if type(comp) is Plain:
+                    pending_text.append(comp.text)
+                    continue
+                if pending_text:
+                    components.append(Plain("".join(pending_text)))
+                    pending_text.clear()
+                components.append(comp)
+        
+        if buffer is not None:
+            if pending_text:
+                components.append(Plain("".join(pending_text)))
+            buffer.chain = components
+            await self.send(buffer)
+        
+        await super().send_streaming(generator, use_fallback)
 
 
 # ============================================================================
@@ -694,27 +772,7 @@ class DesktopMessageEvent(AstrMessageEvent):
 @register_platform_adapter(
     adapter_name="desktop_assistant",
     desc="桌面悬浮球助手 (服务端) - 提供桌面感知和主动对话功能",
-    default_config_tmpl={
-        "type": "desktop_assistant",
-        "enable": True,
-        "id": "desktop_assistant",
-        # WebSocket 配置
-        "ws_host": "0.0.0.0",
-        "ws_port": 6190,
-        # 桌面监控配置
-        "enable_desktop_monitor": True,
-        "monitor_interval": 60,
-        "max_screenshots": 20,
-        "screenshot_max_age_hours": 24,
-        # 主动对话配置
-        "enable_proactive_dialog": True,
-        "proactive_min_interval": 300,
-        "proactive_max_interval": 900,
-        "proactive_probability": 0.3,
-        "window_change_enabled": True,
-        "window_change_probability": 0.2,
-        "scheduled_greetings_enabled": True,
-    },
+    default_config_tmpl=dict(ADAPTER_DEFAULT_CONFIG),
     adapter_display_name="桌面悬浮球助手",
     support_streaming_message=True
 )
@@ -726,6 +784,8 @@ class DesktopAssistantAdapter(Platform):
         self.config = platform_config
         
         self._running = False
+        # 停止信号：_run 阻塞等待该事件，而不是每秒轮询 _running
+        self._stop_event = asyncio.Event()
         self._pending_replies: dict[str, float] = {}
         self._pending_reply_ttl = 120.0
         
@@ -748,6 +808,10 @@ class DesktopAssistantAdapter(Platform):
     def meta(self) -> PlatformMetadata:
         """返回平台元数据"""
         return self.metadata
+    
+    def _get_config(self, key: str) -> Any:
+        """读取适配器配置，缺失时使用 ADAPTER_DEFAULT_CONFIG 中的默认值"""
+        return self.config.get(key, ADAPTER_DEFAULT_CONFIG[key])
         
     async def send_by_session(
         self,
@@ -755,20 +819,11 @@ class DesktopAssistantAdapter(Platform):
         message_chain: MessageChain,
     ):
         """通过会话发送消息"""
-        # 调试日志 - 验证分段消息路由
-        logger.debug(f"[send_by_session] platform_name={session.platform_name}, session_id={session.session_id}, content={str(message_chain)[:50]}...")
+        # 调试日志 - 验证分段消息路由（未开启 DEBUG 时跳过消息链的字符串化）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[send_by_session] platform_name={session.platform_name}, session_id={session.session_id}, content={str(message_chain)[:50]}...")
         
-        # 通过 WebSocket 发送消息到客户端
-        try:
-            msg_data = {
-                "type": "message",
-                "content": str(message_chain),
-                "session_id": session.session_id
-            }
-            await client_manager.send_message(session.session_id, msg_data)
-        except Exception as e:
-            logger.error(f"WebSocket 发送消息失败: {e}")
-            
+        await _send_chain_to_client(session.session_id, message_chain)
         await super().send_by_session(session, message_chain)
                 
     def run(self):
@@ -781,14 +836,14 @@ class DesktopAssistantAdapter(Platform):
         
         try:
             self._running = True
+            self._stop_event.clear()
             self.status = self.status.__class__.RUNNING
             
             # 启动桌面监控和主动对话服务
             await self._start_monitor_services()
             
-            # 保持运行，等待客户端连接或其他事件
-            while self._running:
-                await asyncio.sleep(1)
+            # 保持运行，直到 terminate() 发出停止信号
+            await self._stop_event.wait()
             
         except Exception as e:
             logger.error(f"桌面悬浮球助手运行错误: {e}")
@@ -801,10 +856,20 @@ class DesktopAssistantAdapter(Platform):
             max_age_hours=self.config.get("screenshot_max_age_hours"),
         )
         # 桌面监控服务（接收客户端上报的数据）
-        if self.config.get("enable_desktop_monitor", True):
+        if self._get_config("enable_desktop_monitor"):
+            # 两个服务共用同一组间隔配置，区间颠倒时 random.randint 会持续抛错，这里统一纠正一次
+            min_interval = self._get_config("proactive_min_interval")
+            max_interval = self._get_config("proactive_max_interval")
+            if min_interval > max_interval:
+                logger.warning(
+                    f"proactive_min_interval({min_interval}) 大于 "
+                    f"proactive_max_interval({max_interval})，已交换两者"
+                )
+                min_interval, max_interval = max_interval, min_interval
+            
             self.desktop_monitor = DesktopMonitorService(
-                proactive_min_interval=self.config.get("proactive_min_interval", 300),
-                proactive_max_interval=self.config.get("proactive_max_interval", 900),
+                proactive_min_interval=min_interval,
+                proactive_max_interval=max_interval,
                 on_state_change=self._on_desktop_state_change,
             )
             
@@ -815,15 +880,15 @@ class DesktopAssistantAdapter(Platform):
             logger.info("桌面监控服务已启动（等待客户端连接）")
             
             # 主动对话服务
-            if self.config.get("enable_proactive_dialog", True):
+            if self._get_config("enable_proactive_dialog"):
                 proactive_config = ProactiveDialogConfig(
                     random_enabled=True,
-                    random_probability=self.config.get("proactive_probability", 0.3),
-                    random_min_interval=self.config.get("proactive_min_interval", 300),
-                    random_max_interval=self.config.get("proactive_max_interval", 900),
-                    window_change_enabled=self.config.get("window_change_enabled", True),
-                    window_change_probability=self.config.get("window_change_probability", 0.2),
-                    scheduled_enabled=self.config.get("scheduled_greetings_enabled", True),
+                    random_probability=self._get_config("proactive_probability"),
+                    random_min_interval=min_interval,
+                    random_max_interval=max_interval,
+                    window_change_enabled=self._get_config("window_change_enabled"),
+                    window_change_probability=self._get_config("window_change_probability"),
+                    scheduled_enabled=self._get_config("scheduled_greetings_enabled"),
                 )
                 
                 self.proactive_dialog = ProactiveDialogService(
@@ -880,16 +945,13 @@ class DesktopAssistantAdapter(Platform):
                 return
                 
             # 构建 AstrBotMessage
-            abm = AstrBotMessage()
-            abm.self_id = "desktop_assistant"
-            abm.sender = MessageMember("proactive_system", "主动对话系统")
-            abm.type = MessageType.FRIEND_MESSAGE
-            abm.session_id = self.session_id
-            abm.message_id = str(uuid.uuid4())
-            abm.timestamp = int(time.time())
-            abm.message = message_parts
-            abm.message_str = message_str
-            abm.raw_message = event
+            abm = self._build_message(
+                session_id=self.session_id,
+                sender=MessageMember("proactive_system", "主动对话系统"),
+                message_parts=message_parts,
+                message_str=message_str,
+                raw_message=event,
+            )
             
             # 创建消息事件并提交（标记为主动对话）
             msg_event = DesktopMessageEvent(
@@ -928,19 +990,18 @@ class DesktopAssistantAdapter(Platform):
         if image_path:
             message_parts.append(Image.fromFileSystem(image_path))
 
-        abm = AstrBotMessage()
-        abm.self_id = "desktop_assistant"
-        abm.sender = MessageMember(str(sender_id), sender_name)
-        abm.type = MessageType.FRIEND_MESSAGE
-        abm.session_id = session_id
-        abm.message_id = str(uuid.uuid4())
-        abm.timestamp = int(time.time())
-        abm.message = message_parts
-        if message_parts:
-            abm.message_str = _message_chain_to_text(MessageChain(message_parts)) or text or "[图片]"
+        if image_path:
+            message_str = _message_chain_to_text(MessageChain(message_parts)) or text or "[图片]"
         else:
-            abm.message_str = text
-        abm.raw_message = {"source": "desktop_assistant_ws"}
+            # 纯文本消息的转换结果就是文本本身，无需再构建消息链遍历一遍
+            message_str = text.strip() or text
+        abm = self._build_message(
+            session_id=session_id,
+            sender=MessageMember(str(sender_id), sender_name),
+            message_parts=message_parts,
+            message_str=message_str,
+            raw_message={"source": "desktop_assistant_ws"},
+        )
 
         msg_event = DesktopMessageEvent(
             message_str=text,
@@ -960,6 +1021,27 @@ class DesktopAssistantAdapter(Platform):
 
         self.commit_event(msg_event)
 
+    @staticmethod
+    def _build_message(
+        session_id: str,
+        sender: MessageMember,
+        message_parts: list,
+        message_str: str,
+        raw_message: Any,
+    ) -> AstrBotMessage:
+        """构建桌面助手的私聊 AstrBotMessage"""
+        abm = AstrBotMessage()
+        abm.self_id = "desktop_assistant"
+        abm.sender = sender
+        abm.type = MessageType.FRIEND_MESSAGE
+        abm.session_id = session_id
+        abm.message_id = str(uuid.uuid4())
+        abm.timestamp = int(time.time())
+        abm.message = message_parts
+        abm.message_str = message_str
+        abm.raw_message = raw_message
+        return abm
+
     def _has_pending_reply(self, session_id: str) -> bool:
         ts = self._pending_replies.get(session_id)
         if not ts:
@@ -979,6 +1061,7 @@ class DesktopAssistantAdapter(Platform):
         logger.info("正在停止桌面悬浮球助手...")
         
         self._running = False
+        self._stop_event.set()
         
         # 停止过期请求清理任务
         try:
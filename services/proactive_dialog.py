@@ -7,7 +7,7 @@
 import asyncio
 import random
 from dataclasses import dataclass, field
-from datetime import datetime, time as dt_time
+from datetime import datetime, time as dt_time, timedelta
 from enum import Enum
 from typing import Any, Callable, Dict, List, Optional
 
@@ -91,6 +91,11 @@ class ProactiveDialogConfig:
 class ProactiveDialogService:
     """主动对话服务"""
     
+    # 定时问候检查的最长休眠时间（秒），兜底应对系统时间跳变
+    SCHEDULED_MAX_SLEEP = 3600
+    # 空闲检查的最长休眠时间（秒），兜底应对 idle_threshold 被调小
+    IDLE_MAX_SLEEP = 300
+    
     def __init__(
         self,
         desktop_monitor: DesktopMonitorService,
@@ -114,6 +119,9 @@ class ProactiveDialogService:
         self._scheduled_task: Optional[asyncio.Task] = None
         self._idle_task: Optional[asyncio.Task] = None
         
+        # 定时问候变更信号：唤醒定时循环重新计算下次检查时间
+        self._schedule_changed = asyncio.Event()
+        
         # 状态追踪
         self._last_random_trigger: Optional[datetime] = None
         self._last_window_change_trigger: Optional[datetime] = None
@@ -241,14 +249,58 @@ class ProactiveDialogService:
                         greeting.last_triggered = now
                         await self._fire_trigger(event)
                         
-                # 每分钟检查一次
-                await asyncio.sleep(60)
+                # 休眠到下一个问候时间窗口，期间问候配置变更会提前唤醒
+                self._schedule_changed.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._schedule_changed.wait(),
+                        timeout=self._seconds_until_next_greeting(datetime.now()),
+                    )
+                except asyncio.TimeoutError:
+                    pass
                 
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"定时触发错误: {e}")
                 await asyncio.sleep(60)
+    
+    def _seconds_until_next_greeting(self, now: datetime) -> float:
+        """
+        计算距离下一个定时问候触发窗口的秒数
+        
+        触发窗口为问候时间前后 1 分钟，今天已触发或窗口已过的问候顺延到明天。
+        与触发检查一致，窗口不跨越午夜：00:00 的问候窗口从当天 00:00 开始。
+        
+        Args:
+            now: 当前时间
+            
+        Returns:
+            休眠秒数，范围 [1, SCHEDULED_MAX_SLEEP]
+        """
+        wait_time = float(self.SCHEDULED_MAX_SLEEP)
+        current_minutes = now.hour * 60 + now.minute
+        
+        for greeting in self.config.scheduled_greetings:
+            if not greeting.enabled:
+                continue
+            
+            greeting_minutes = greeting.time.hour * 60 + greeting.time.minute
+            triggered_today = (
+                greeting.last_triggered is not None
+                and greeting.last_triggered.date() == now.date()
+            )
+            window_date = now.date()
+            if triggered_today or current_minutes > greeting_minutes + 1:
+                window_date += timedelta(days=1)
+            window_start = max(
+                datetime.combine(window_date, greeting.time) - timedelta(minutes=1),
+                datetime.combine(window_date, dt_time(0, 0)),
+            )
+            
+            wait_time = min(wait_time, (window_start - now).total_seconds())
+        
+        return max(1.0, wait_time)
                 
     async def _idle_trigger_loop(self):
         """空闲触发循环"""
@@ -274,8 +326,12 @@ class ProactiveDialogService:
                     
                     # 重置活动时间，避免重复触发
                     self._last_activity_time = now
-                    
-                await asyncio.sleep(30)  # 每 30 秒检查一次
+                    idle_duration = 0
+                
+                # 直接休眠到预计达到空闲阈值的时刻，期间的用户活动只会推迟触发，
+                # 醒来后重新计算即可，无需每 30 秒轮询
+                remaining = self.config.idle_threshold - idle_duration
+                await asyncio.sleep(min(max(1.0, remaining), self.IDLE_MAX_SLEEP))
                 
             except asyncio.CancelledError:
                 break
@@ -335,16 +391,26 @@ class ProactiveDialogService:
         """记录用户活动（用于空闲检测）"""
         self._last_activity_time = datetime.now()
         
-    def update_config(self, **kwargs):
+    def update_config(self, **kwargs) -> Dict[str, Any]:
         """
         更新配置
         
+        只写入值发生变化的配置项，没有任何变化时不唤醒定时循环。
+        
         Args:
             **kwargs: 配置参数
+            
+        Returns:
+            实际发生变化的配置项
         """
+        changed = {}
         for key, value in kwargs.items():
-            if hasattr(self.config, key):
+            if hasattr(self.config, key) and getattr(self.config, key) != value:
                 setattr(self.config, key, value)
+                changed[key] = value
+        if changed:
+            self._schedule_changed.set()
+        return changed
                 
     def add_scheduled_greeting(
         self,
@@ -368,6 +434,7 @@ class ProactiveDialogService:
             enabled=enabled
         )
         self.config.scheduled_greetings.append(greeting)
+        self._schedule_changed.set()
         
     def remove_scheduled_greeting(self, index: int):
         """
@@ -378,6 +445,7 @@ class ProactiveDialogService:
         """
         if 0 <= index < len(self.config.scheduled_greetings):
             self.config.scheduled_greetings.pop(index)
+            self._schedule_changed.set()
             
     def get_status(self) -> dict:
         """
@@ -63,6 +63,15 @@ class VisionAnalyzer:
 
 请用简洁的中文描述，不要过于详细，重点关注用户可能关心的内容。"""
 
+    # 桌面截图分析提示词（口语化，模拟"看到"用户屏幕）
+    DESKTOP_ANALYSIS_PROMPT = """你现在看到的是用户电脑桌面的实时截图。请简洁地描述：
+
+1. 用户当前在做什么？
+2. 屏幕上有哪些主要的应用或内容？
+3. 有什么值得注意的信息吗？
+
+请用口语化的方式回答，就像你真的能"看到"用户的屏幕一样。"""
+
     def __init__(
         self,
         context,
@@ -216,17 +225,9 @@ class VisionAnalyzer:
         Returns:
             VisionAnalysisResult: 分析结果
         """
-        desktop_prompt = """你现在看到的是用户电脑桌面的实时截图。请简洁地描述：
-
-1. 用户当前在做什么？
-2. 屏幕上有哪些主要的应用或内容？
-3. 有什么值得注意的信息吗？
-
-请用口语化的方式回答，就像你真的能"看到"用户的屏幕一样。"""
-        
         return await self.analyze_image(
             image_path=image_path,
-            prompt=desktop_prompt,
+            prompt=self.DESKTOP_ANALYSIS_PROMPT,
             umo=umo,
         )
     
@@ -11,16 +11,25 @@ WebSocket 客户端管理器和消息处理模块
 
 import asyncio
 import base64
+import binascii
+import hashlib
+import logging
 import os
 import time
+import traceback
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 from astrbot.api import logger
 
 
+# 消息缺少 data 字段时使用的只读空映射，避免每条消息都分配一个新的空字典
+_EMPTY_DATA = MappingProxyType({})
+
+
 @dataclass
 class ClientDesktopState:
     """
@@ -47,9 +56,14 @@ class ClientDesktopState:
     @classmethod
     def from_dict(cls, session_id: str, data: dict) -> "ClientDesktopState":
         """从字典创建实例"""
+        # 只取一次当前时间；客户端通常自带时间戳，仅在缺失时才格式化默认值
+        now = datetime.now()
+        timestamp = data.get("timestamp")
+        if timestamp is None:
+            timestamp = now.isoformat()
         return cls(
             session_id=session_id,
-            timestamp=data.get("timestamp", datetime.now().isoformat()),
+            timestamp=timestamp,
             active_window_title=data.get("active_window_title"),
             active_window_process=data.get("active_window_process"),
             active_window_pid=data.get("active_window_pid"),
@@ -59,7 +73,7 @@ class ClientDesktopState:
             running_apps=data.get("running_apps"),
             window_changed=data.get("window_changed", False),
             previous_window_title=data.get("previous_window_title"),
-            received_at=datetime.now(),
+            received_at=now,
         )
 
 
@@ -129,6 +143,9 @@ class ClientManager:
     EXPIRED_REQUEST_CLEANUP_INTERVAL = 30  # 清理间隔（秒）
     SCREENSHOT_REQUEST_MAX_AGE = 60  # 截图请求最大存活时间（秒）
     
+    # 连接质量排序（数值越小越优先）
+    CONNECTION_QUALITY_ORDER = {"excellent": 0, "good": 1, "fair": 2, "poor": 3, "unknown": 4}
+    
     def __init__(self):
         # 存储客户端的最新桌面状态: session_id -> ClientDesktopState
         self.client_states: Dict[str, ClientDesktopState] = {}
@@ -142,7 +159,8 @@ class ClientManager:
         
         # 截图保存目录
         self._screenshot_save_dir = "./temp/remote_screenshots"
-        os.makedirs(self._screenshot_save_dir, exist_ok=True)
+        # 目录在首次保存图片时才创建，避免模块导入时就触碰文件系统
+        self._screenshot_dir_ready = False
 
         # 截图保留策略
         self._max_screenshots = 20
@@ -197,7 +215,8 @@ class ClientManager:
                     break
                 
                 cleaned_count = self._cleanup_expired_requests()
-                cleaned_files = self._cleanup_screenshot_files()
+                # 目录遍历与文件删除是阻塞 I/O，放到工作线程执行
+                cleaned_files = await asyncio.to_thread(self._cleanup_screenshot_files)
                 
                 if cleaned_count > 0:
                     logger.info(f"已清理 {cleaned_count} 个过期截图请求")
@@ -267,6 +286,12 @@ class ClientManager:
             except (TypeError, ValueError):
                 logger.warning(f"无效的 screenshot_max_age_hours 配置: {max_age_hours}")
 
+    def _ensure_screenshot_dir(self):
+        """确保截图保存目录存在（每个进程只创建一次）"""
+        if not self._screenshot_dir_ready:
+            os.makedirs(self._screenshot_save_dir, exist_ok=True)
+            self._screenshot_dir_ready = True
+
     def _cleanup_screenshot_files(self) -> int:
         """清理截图文件"""
         if not os.path.isdir(self._screenshot_save_dir):
@@ -276,28 +301,33 @@ class ClientManager:
 
         now = time.time()
         max_age_seconds = self._screenshot_max_age_hours * 3600
+        # scandir 一次遍历同时拿到文件类型和 mtime，避免对每个文件重复 stat
         entries = []
-        for name in os.listdir(self._screenshot_save_dir):
-            path = os.path.join(self._screenshot_save_dir, name)
-            if not os.path.isfile(path):
-                continue
-            try:
-                entries.append((os.path.getmtime(path), path))
-            except OSError:
-                continue
+        with os.scandir(self._screenshot_save_dir) as it:
+            for entry in it:
+                # 跳过正在写入的临时文件，它们既不计入数量也不参与清理
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    if entry.is_file():
+                        entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
 
         removed = 0
+        removed_paths = set()
         if self._screenshot_max_age_hours > 0:
             for mtime, path in entries:
                 if now - mtime > max_age_seconds:
                     try:
                         os.remove(path)
                         removed += 1
+                        removed_paths.add(path)
                     except OSError as e:
                         logger.debug(f"删除截图失败: {path} ({e})")
 
         if self._max_screenshots > 0:
-            remaining = [(mtime, path) for mtime, path in entries if os.path.exists(path)]
+            remaining = [(mtime, path) for mtime, path in entries if path not in removed_paths]
             if len(remaining) > self._max_screenshots:
                 remaining.sort(key=lambda item: item[0])
                 over_limit = len(remaining) - self._max_screenshots
@@ -337,11 +367,7 @@ class ClientManager:
             return False
         
         # 使用服务器的连接状态检查
-        if hasattr(self._ws_server, 'is_client_connected'):
-            return self._ws_server.is_client_connected(session_id)
-        
-        # 回退到简单的列表检查
-        return session_id in self.get_connected_client_ids()
+        return self._ws_server.is_client_connected(session_id)
     
     def get_client_connection_info(self, session_id: str) -> dict:
         """
@@ -366,30 +392,19 @@ class ClientManager:
             info["connected"] = session_id in self._ws_server.get_connected_client_ids()
             
             # 获取最后活跃时间
-            if hasattr(self._ws_server, 'get_client_last_activity'):
-                last_activity = self._ws_server.get_client_last_activity(session_id)
-                if last_activity > 0:
-                    info["last_activity"] = last_activity
-                    seconds_since = time.time() - last_activity
-                    info["seconds_since_activity"] = seconds_since
-                    
-                    # 评估连接质量
-                    if seconds_since < 30:
-                        info["connection_quality"] = "excellent"
-                    elif seconds_since < 60:
-                        info["connection_quality"] = "good"
-                    elif seconds_since < 120:
-                        info["connection_quality"] = "fair"
-                    else:
-                        info["connection_quality"] = "poor"
+            last_activity = self._ws_server.get_client_last_activity(session_id)
+            if last_activity > 0:
+                info["last_activity"] = last_activity
+                seconds_since = time.time() - last_activity
+                info["seconds_since_activity"] = seconds_since
+                info["connection_quality"] = self._evaluate_connection_quality(seconds_since)
             
             # 获取服务器统计信息
-            if hasattr(self._ws_server, 'get_server_stats'):
-                stats = self._ws_server.get_server_stats()
-                conn_details = stats.get("connection_details", {})
-                if session_id in conn_details:
-                    client_stats = conn_details[session_id]
-                    info["heartbeat_count"] = client_stats.get("heartbeat_count", 0)
+            stats = self._ws_server.get_server_stats()
+            conn_details = stats.get("connection_details", {})
+            if session_id in conn_details:
+                client_stats = conn_details[session_id]
+                info["heartbeat_count"] = client_stats.get("heartbeat_count", 0)
         
         # 检查是否有桌面状态
         if session_id in self.client_states:
@@ -400,6 +415,17 @@ class ClientManager:
         
         return info
     
+    @staticmethod
+    def _evaluate_connection_quality(seconds_since_activity: float) -> str:
+        """根据距最后活跃的秒数评估连接质量"""
+        if seconds_since_activity < 30:
+            return "excellent"
+        if seconds_since_activity < 60:
+            return "good"
+        if seconds_since_activity < 120:
+            return "fair"
+        return "poor"
+    
     async def send_message(self, session_id: str, message: dict) -> bool:
         """
         发送消息给指定客户端
@@ -446,28 +472,35 @@ class ClientManager:
         """
         state = ClientDesktopState.from_dict(session_id, state_data)
         self.client_states[session_id] = state
-        logger.debug(f"客户端桌面状态已更新: session_id={session_id}, window={state.active_window_title}")
+        # 桌面状态会周期性上报，未开启 DEBUG 时跳过日志字符串的格式化
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"客户端桌面状态已更新: session_id={session_id}, window={state.active_window_title}")
         return state
 
-    def save_base64_image(self, base64_data: str, filename_prefix: str = "ws_upload") -> Optional[str]:
-        """保存 Base64 图片到本地文件，返回文件路径"""
+    async def save_base64_image(self, base64_data: str, filename_prefix: str = "ws_upload") -> Optional[str]:
+        """
+        保存 Base64 图片到本地文件，返回文件路径
+        
+        解码和写文件在线程池中执行，避免大图阻塞事件循环。
+        文件名由图片内容哈希生成，重复发送同一张图片时复用已有文件。
+        """
         if not base64_data:
             return None
-        data = base64_data.strip()
-        if data.startswith("data:"):
-            parts = data.split(",", 1)
-            if len(parts) == 2:
-                data = parts[1]
+        # 只检查开头判断是否为 data URL，避免对整段大字符串 strip/split 复制；
+        # 首尾空白由 b64decode 自行忽略
+        data = base64_data
+        if data[:64].lstrip().startswith("data:"):
+            comma = data.find(",")
+            if comma != -1:
+                data = data[comma + 1:]
         try:
-            image_bytes = base64.b64decode(data)
-        except Exception as e:
+            self._ensure_screenshot_dir()
+            filepath = await asyncio.to_thread(
+                self._write_base64_image_dedup, data, self._screenshot_save_dir, filename_prefix
+            )
+        except (binascii.Error, ValueError) as e:
             logger.error(f"Base64 图片解码失败: {e}")
             return None
-        filename = f"{filename_prefix}_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}.png"
-        filepath = os.path.join(self._screenshot_save_dir, filename)
-        try:
-            with open(filepath, "wb") as f:
-                f.write(image_bytes)
         except Exception as e:
             logger.error(f"保存图片失败: {e}")
             return None
@@ -595,16 +628,21 @@ class ClientManager:
         if len(client_ids) == 1:
             return client_ids[0]
         
-        # 按连接质量排序
-        quality_order = {"excellent": 0, "good": 1, "fair": 2, "poor": 3, "unknown": 4}
+        if not self._ws_server:
+            return client_ids[0]
+        
+        # 只读取最后活跃时间评估连接质量；get_client_connection_info 每次都会
+        # 构建完整的服务器统计，逐个调用会让选择过程随客户端数平方增长
+        now = time.time()
         
         def get_quality_score(client_id: str) -> int:
-            info = self.get_client_connection_info(client_id)
-            quality = info.get("connection_quality", "unknown")
-            return quality_order.get(quality, 5)
+            last_activity = self._ws_server.get_client_last_activity(client_id)
+            if last_activity <= 0:
+                return self.CONNECTION_QUALITY_ORDER["unknown"]
+            quality = self._evaluate_connection_quality(now - last_activity)
+            return self.CONNECTION_QUALITY_ORDER[quality]
         
-        sorted_clients = sorted(client_ids, key=get_quality_score)
-        return sorted_clients[0]
+        return min(client_ids, key=get_quality_score)
     
     async def _do_screenshot_request(self, session_id: str, timeout: float) -> ScreenshotResponse:
         """
@@ -667,7 +705,6 @@ class ClientManager:
             )
         except Exception as e:
             logger.error(f"截图请求失败: {e}")
-            import traceback
             traceback.print_exc()
             return ScreenshotResponse(
                 request_id=request_id,
@@ -680,10 +717,12 @@ class ClientManager:
             self._pending_screenshot_requests.pop(request_id, None)
             self._screenshot_futures.pop(request_id, None)
     
-    def handle_screenshot_response(self, session_id: str, data: dict) -> Optional[ScreenshotResponse]:
+    async def handle_screenshot_response(self, session_id: str, data: dict) -> Optional[ScreenshotResponse]:
         """
         处理客户端返回的截图响应
         
+        截图的 Base64 解码和写文件在线程池中执行，避免大图阻塞事件循环。
+        
         Args:
             session_id: 客户端 session_id
             data: 响应数据
@@ -718,12 +757,11 @@ class ClientManager:
         # 如果成功且有图片数据，保存到文件
         if success and image_base64:
             try:
-                image_data = base64.b64decode(image_base64)
                 filename = f"screenshot_{request_id}_{int(time.time() * 1000)}.png"
+                self._ensure_screenshot_dir()
                 filepath = os.path.join(self._screenshot_save_dir, filename)
                 
-                with open(filepath, "wb") as f:
-                    f.write(image_data)
+                await asyncio.to_thread(self._write_base64_file, image_base64, filepath)
                 
                 response.image_path = filepath
                 logger.info(f"截图已保存: {filepath}")
@@ -737,6 +775,48 @@ class ClientManager:
         
         return response
     
+    @staticmethod
+    def _write_base64_file(base64_data: str, filepath: str):
+        """解码 Base64 数据并写入文件（在工作线程中调用）"""
+        image_data = base64.b64decode(base64_data)
+        with open(filepath, "wb") as f:
+            f.write(image_data)
+    
+    @staticmethod
+    def _write_base64_image_dedup(base64_data: str, save_dir: str, filename_prefix: str) -> str:
+        """
+        解码 Base64 图片并按内容哈希命名保存（在工作线程中调用）
+        
+        文件已存在时只刷新修改时间，使其不会被保留策略当作旧文件清理。
+        新文件先写入同目录下的临时文件再原子替换到目标路径，
+        并发上传同一张图片时不会读到写了一半的文件。
+        
+        Returns:
+            图片文件路径
+        """
+        image_data = base64.b64decode(base64_data)
+        digest = hashlib.blake2b(image_data, digest_size=8).hexdigest()
+        filepath = os.path.join(save_dir, f"{filename_prefix}_{digest}.png")
+        try:
+            os.utime(filepath)
+            return filepath
+        except FileNotFoundError:
+            # 文件不存在（或刚被保留策略清理），重新写入
+            pass
+        
+        tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(image_data)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return filepath
+    
     def get_screenshot_stats(self) -> dict:
         """
         获取截图统计信息
@@ -777,6 +857,16 @@ class MessageHandler:
         self.on_config_sync: Optional[Callable[[str, dict], Any]] = None
         # 客户端聊天消息回调（由 main.py 设置）
         self.on_chat_message: Optional[Callable[[str, dict], Any]] = None
+        
+        # 消息类型分发表: type -> handler(session_id, data)
+        self._handlers: Dict[str, Callable[[str, dict], Awaitable[None]]] = {
+            "desktop_state": self._handle_desktop_state,
+            "screenshot_response": self._handle_screenshot_response,
+            "command_result": self._handle_command_result,
+            "config_sync": self._handle_config_sync,
+            "chat_message": self._handle_chat_message,
+            "state_sync": self._handle_state_sync,
+        }
     
     async def handle_message(self, session_id: str, data: dict):
         """
@@ -788,41 +878,16 @@ class MessageHandler:
         """
         msg_type = data.get("type", "")
         
-        if msg_type == "desktop_state":
-            # 处理桌面状态上报
-            await self._handle_desktop_state(session_id, data)
-            
-        elif msg_type == "screenshot_response":
-            # 处理截图响应
-            response_data = data.get("data", {})
-            self.manager.handle_screenshot_response(session_id, response_data)
-            logger.debug(f"收到截图响应: session_id={session_id}")
-            
-        elif msg_type == "command_result":
-            # 处理通用命令执行结果
-            command = data.get("command")
-            if command == "screenshot":
-                response_data = data.get("data", {})
-                self.manager.handle_screenshot_response(session_id, response_data)
-        
-        elif msg_type == "config_sync":
-            # 处理客户端配置同步
-            await self._handle_config_sync(session_id, data)
-                
-        elif msg_type == "chat_message":
-            # 处理客户端聊天消息
-            await self._handle_chat_message(session_id, data)
-                
-        elif msg_type == "state_sync":
-            # 处理客户端状态同步（保留向后兼容）
-            pass
-        
-        else:
+        handler = self._handlers.get(msg_type)
+        if handler is None:
             logger.debug(f"收到未知类型消息: type={msg_type}, session_id={session_id}")
+            return
+        
+        await handler(session_id, data)
     
     async def _handle_desktop_state(self, session_id: str, data: dict):
         """处理桌面状态上报"""
-        state_data = data.get("data", {})
+        state_data = data.get("data", _EMPTY_DATA)
         state = self.manager.update_client_state(session_id, state_data)
         
         # 触发回调（如果设置）
@@ -840,6 +905,23 @@ class MessageHandler:
             "timestamp": state.timestamp,
         })
     
+    async def _handle_screenshot_response(self, session_id: str, data: dict):
+        """处理截图响应"""
+        response_data = data.get("data", _EMPTY_DATA)
+        await self.manager.handle_screenshot_response(session_id, response_data)
+        logger.debug(f"收到截图响应: session_id={session_id}")
+    
+    async def _handle_command_result(self, session_id: str, data: dict):
+        """处理通用命令执行结果"""
+        command = data.get("command")
+        if command == "screenshot":
+            response_data = data.get("data", _EMPTY_DATA)
+            await self.manager.handle_screenshot_response(session_id, response_data)
+    
+    async def _handle_state_sync(self, session_id: str, data: dict):
+        """处理客户端状态同步（保留向后兼容，无需处理）"""
+        pass
+    
     async def _handle_config_sync(self, session_id: str, data: dict):
         """
         处理客户端配置同步
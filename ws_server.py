@@ -9,6 +9,8 @@
 
 import asyncio
 import json
+import logging
+import time
 import traceback
 from typing import Optional, Callable, Any, Dict, Set
 from urllib.parse import parse_qs, urlparse
@@ -54,6 +56,9 @@ class StandaloneWebSocketServer:
     # 忙碌状态超时延长
     BUSY_STATE_TIMEOUT_EXTENSION = 120  # 忙碌状态下的超时延长（秒）
     
+    # 允许的连接路径（/ws/client 标准路径，/ 与空路径为根路径兼容）
+    VALID_PATHS = ("/ws/client", "/", "")
+    
     def __init__(
         self,
         host: str = "0.0.0.0",
@@ -106,6 +111,16 @@ class StandaloneWebSocketServer:
         self._total_server_pings: int = 0  # 服务端发送的 ping 总数
         self._total_server_pongs: int = 0  # 收到的 pong 响应总数
         
+        # 下发给客户端的服务端配置，均为常量，只构建一次供 connection_status / server_config 复用
+        self._client_config: Dict[str, Any] = {
+            "ping_interval": self.PING_INTERVAL,
+            "ping_timeout": self.PING_TIMEOUT,
+            "health_check_interval": self.HEALTH_CHECK_INTERVAL,
+            "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
+            "server_ping_interval": self.SERVER_PING_INTERVAL,
+            "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
+        }
+        
     @property
     def is_running(self) -> bool:
         """服务器是否正在运行"""
@@ -247,9 +262,8 @@ class StandaloneWebSocketServer:
         params = parse_qs(query_string)
         
         # 验证路径（支持 /ws/client 和 / 两种路径）
-        valid_paths = ["/ws/client", "/", ""]
-        if path_part not in valid_paths:
-            logger.warning(f"WebSocket 连接拒绝: 无效路径 '{path_part}'，支持的路径: {valid_paths}")
+        if path_part not in self.VALID_PATHS:
+            logger.warning(f"WebSocket 连接拒绝: 无效路径 '{path_part}'，支持的路径: {list(self.VALID_PATHS)}")
             await websocket.close(1008, f"Invalid path: {path_part}")
             return
         
@@ -276,7 +290,6 @@ class StandaloneWebSocketServer:
                 return
         
         # 记录连接和活跃时间
-        import time
         self.connections[session_id] = websocket
         self._last_activity[session_id] = time.time()
         self._heartbeat_counts[session_id] = 0
@@ -289,14 +302,7 @@ class StandaloneWebSocketServer:
             "status": "connected",
             "session_id": session_id,
             "server_time": time.time(),
-            "config": {
-                "ping_interval": self.PING_INTERVAL,
-                "ping_timeout": self.PING_TIMEOUT,
-                "health_check_interval": self.HEALTH_CHECK_INTERVAL,
-                "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
-                "server_ping_interval": self.SERVER_PING_INTERVAL,
-                "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
-            }
+            "config": self._client_config,
         })
         
         # 触发连接回调
@@ -335,21 +341,29 @@ class StandaloneWebSocketServer:
             logger.error(traceback.format_exc())
         finally:
             # 清理连接和相关记录
-            self.connections.pop(session_id, None)
-            self._last_activity.pop(session_id, None)
-            self._heartbeat_counts.pop(session_id, None)
-            self._busy_states.pop(session_id, None)
-            self._total_disconnections += 1
+            self._remove_connection(session_id)
             logger.info(f"客户端已移除: session_id={session_id}，剩余连接数: {len(self.connections)}")
             
             # 触发断开回调
-            if self.on_client_disconnect:
-                try:
-                    result = self.on_client_disconnect(session_id)
-                    if asyncio.iscoroutine(result):
-                        await result
-                except Exception as e:
-                    logger.error(f"断开回调执行失败: {e}")
+            await self._notify_disconnect(session_id)
+    
+    def _remove_connection(self, session_id: str):
+        """移除连接及其活跃时间、心跳计数、忙碌状态记录"""
+        self.connections.pop(session_id, None)
+        self._last_activity.pop(session_id, None)
+        self._heartbeat_counts.pop(session_id, None)
+        self._busy_states.pop(session_id, None)
+        self._total_disconnections += 1
+    
+    async def _notify_disconnect(self, session_id: str):
+        """触发断开回调"""
+        if self.on_client_disconnect:
+            try:
+                result = self.on_client_disconnect(session_id)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"断开回调执行失败: session_id={session_id}, error={e}")
     
     async def _handle_message(
         self,
@@ -358,7 +372,6 @@ class StandaloneWebSocketServer:
         data: dict
     ):
         """处理客户端消息"""
-        import time
         msg_type = data.get("type", "")
         
         # 更新客户端活跃时间
@@ -395,9 +408,8 @@ class StandaloneWebSocketServer:
                 busy_until = time.time() + min(duration, self.BUSY_STATE_TIMEOUT_EXTENSION)
                 self._busy_states[session_id] = busy_until
                 logger.info(f"客户端 {session_id} 进入忙碌状态: {operation}，延长超时 {duration}s")
-            else:
-                # 清除忙碌状态
-                self._busy_states.pop(session_id, None)
+            elif self._busy_states.pop(session_id, None) is not None:
+                # 清除忙碌状态（本就不忙时只回确认，不重复记录日志）
                 logger.info(f"客户端 {session_id} 退出忙碌状态: {operation}")
             
             # 确认忙碌状态
@@ -413,14 +425,7 @@ class StandaloneWebSocketServer:
         if msg_type == "get_config":
             await self._send_json(websocket, {
                 "type": "server_config",
-                "config": {
-                    "ping_interval": self.PING_INTERVAL,
-                    "ping_timeout": self.PING_TIMEOUT,
-                    "health_check_interval": self.HEALTH_CHECK_INTERVAL,
-                    "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
-                    "server_ping_interval": self.SERVER_PING_INTERVAL,
-                    "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
-                },
+                "config": self._client_config,
                 "server_time": time.time()
             })
             logger.debug(f"已向客户端 {session_id} 发送服务端配置")
@@ -442,8 +447,6 @@ class StandaloneWebSocketServer:
         
         定期检查所有连接的健康状态，清理死连接
         """
-        import time
-        
         while self._running:
             try:
                 await asyncio.sleep(self.HEALTH_CHECK_INTERVAL)
@@ -521,8 +524,6 @@ class StandaloneWebSocketServer:
             session_id: 要清理的客户端 session_id
             reason: 清理原因
         """
-        import time
-        
         # 收集诊断信息
         ws = self.connections.get(session_id)
         last_activity = self._last_activity.get(session_id, 0)
@@ -543,7 +544,8 @@ class StandaloneWebSocketServer:
             f"连接打开状态={getattr(ws, 'open', 'N/A') if ws else 'N/A'}"
         )
         
-        if ws:
+        # 连接已关闭时无需再发送通知和关闭帧（必然失败，只会产生错误日志）
+        if ws and getattr(ws, 'open', True):
             try:
                 # 尝试发送关闭通知
                 await self._send_json(ws, {
@@ -555,20 +557,10 @@ class StandaloneWebSocketServer:
                 logger.debug(f"关闭死连接 {session_id} 失败（可能已断开）: {e}")
         
         # 清理记录
-        self.connections.pop(session_id, None)
-        self._last_activity.pop(session_id, None)
-        self._heartbeat_counts.pop(session_id, None)
-        self._busy_states.pop(session_id, None)
-        self._total_disconnections += 1
+        self._remove_connection(session_id)
         
         # 触发断开回调
-        if self.on_client_disconnect:
-            try:
-                result = self.on_client_disconnect(session_id)
-                if asyncio.iscoroutine(result):
-                    await result
-            except Exception as e:
-                logger.error(f"断开回调执行失败: {e}")
+        await self._notify_disconnect(session_id)
         
         logger.info(f"已清理死连接: session_id={session_id}, 剩余连接数: {len(self.connections)}")
     
@@ -583,8 +575,9 @@ class StandaloneWebSocketServer:
         Returns:
             是否发送成功
         """
-        # 调试日志：打印当前所有连接
-        logger.debug(f"[发送调试] 尝试发送到 session_id={session_id}, 当前连接数={len(self.connections)}, 连接列表={list(self.connections.keys())}")
+        # 调试日志（连接列表仅在发送失败时输出，避免每次发送都构造列表）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[发送调试] 尝试发送到 session_id={session_id}, 当前连接数={len(self.connections)}")
         
         websocket = self.connections.get(session_id)
         if not websocket:
@@ -603,12 +596,13 @@ class StandaloneWebSocketServer:
         Returns:
             成功发送的客户端数量
         """
-        import time
         success_count = 0
         failed_sessions = []
         
+        # 只序列化一次，所有客户端复用同一份 payload
+        payload = json.dumps(data, ensure_ascii=False)
         for session_id, websocket in list(self.connections.items()):
-            if await self._send_json(websocket, data):
+            if await self._send_text(websocket, payload):
                 success_count += 1
             else:
                 # 发送失败，记录需要清理的连接
@@ -629,27 +623,21 @@ class StandaloneWebSocketServer:
             )
             
             # 完整清理所有相关状态
-            self.connections.pop(session_id, None)
-            self._last_activity.pop(session_id, None)
-            self._heartbeat_counts.pop(session_id, None)
-            self._busy_states.pop(session_id, None)
-            self._total_disconnections += 1
+            self._remove_connection(session_id)
             
             # 触发断开回调
-            if self.on_client_disconnect:
-                try:
-                    result = self.on_client_disconnect(session_id)
-                    if asyncio.iscoroutine(result):
-                        await result
-                except Exception as e:
-                    logger.error(f"广播清理时断开回调执行失败: {e}")
+            await self._notify_disconnect(session_id)
         
         return success_count
     
     async def _send_json(self, websocket: WebSocketServerProtocol, data: dict) -> bool:
         """发送 JSON 数据"""
+        return await self._send_text(websocket, json.dumps(data, ensure_ascii=False))
+    
+    async def _send_text(self, websocket: WebSocketServerProtocol, payload: str) -> bool:
+        """发送已序列化的 JSON 文本"""
         try:
-            await websocket.send(json.dumps(data, ensure_ascii=False))
+            await websocket.send(payload)
             return True
         except Exception as e:
             # 记录详细的发送失败信息
@@ -707,7 +695,6 @@ class StandaloneWebSocketServer:
         Returns:
             包含连接统计的字典
         """
-        import time
         current_time = time.time()
         
         # 计算每个连接的活跃时间
@@ -735,8 +722,6 @@ class StandaloneWebSocketServer:
         
         定期向所有客户端发送 server_ping，检测连接活性
         """
-        import time
-        
         while self._running:
             try:
                 await asyncio.sleep(self.SERVER_PING_INTERVAL)
@@ -745,16 +730,17 @@ class StandaloneWebSocketServer:
                     break
                 
                 current_time = time.time()
+                payload = json.dumps({
+                    "type": "server_ping",
+                    "timestamp": current_time,
+                    "server_time": current_time
+                })
                 
-                # 向所有连接的客户端发送 server_ping
+                # 向所有连接的客户端发送 server_ping（同一份 payload）
                 for session_id, ws in list(self.connections.items()):
                     try:
                         if hasattr(ws, 'open') and ws.open:
-                            await self._send_json(ws, {
-                                "type": "server_ping",
-                                "timestamp": current_time,
-                                "server_time": current_time
-                            })
+                            await self._send_text(ws, payload)
                             self._total_server_pings += 1
                     except Exception as e:
                         logger.debug(f"向客户端 {session_id} 发送 server_ping 失败: {e}")
@@ -781,7 +767,6 @@ class StandaloneWebSocketServer:
         Returns:
             是否发送成功
         """
-        import time
         ws = self.connections.get(session_id)
         if not ws:
             return False